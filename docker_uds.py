@@ -0,0 +1,124 @@
+import http.client
+import json
+import socket
+import threading
+from urllib.parse import urlencode
+
+try:
+    # orjson parsuje odpowiedzi (np. statystyki kontenerów) kilka razy szybciej niż json
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+DOCKER_SOCKET = '/var/run/docker.sock'
+
+
+class DockerAPIError(Exception):
+    """Błąd zwrócony przez Docker Engine API."""
+
+    def __init__(self, status, body):
+        super().__init__(f"Docker API {status}: {body.decode(errors='replace').strip()}")
+        self.status = status
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """Połączenie HTTP przez gniazdo uniksowe."""
+
+    def __init__(self, socket_path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DockerUDS:
+    """Minimalny klient Docker Engine API z pulą połączeń keep-alive do gniazda Dockera."""
+
+    def __init__(self, socket_path=DOCKER_SOCKET, timeout=10):
+        """
+        :param socket_path: Ścieżka do gniazda uniksowego Dockera.
+        :param timeout: Limit czasu (sekundy) na pojedyncze zapytanie.
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        # Wolne połączenia; równoległe zapytania (np. restart i pomiar) nie czekają na siebie nawzajem
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def request(self, method, path, body=None, timeout=None):
+        """Wysyła zapytanie do Docker API i zwraca zdekodowaną odpowiedź JSON (None dla pustej odpowiedzi).
+
+        :param timeout: Limit czasu (sekundy) dla tego zapytania; domyślnie limit klienta.
+        """
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        conn = self._acquire()
+        # Połączenia z puli są współdzielone, więc limit czasu ustawiamy przy każdym zapytaniu
+        conn.timeout = timeout or self.timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(conn.timeout)
+        try:
+            try:
+                response = self._send(conn, method, path, payload, headers)
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # Docker zamknął bezczynne połączenie - ponawiamy raz na nowym
+                response = self._send(conn, method, path, payload, headers)
+            data = response.read()
+        except Exception:
+            conn.close()
+            raise
+        self._release(conn)
+
+        if response.status >= 400:
+            raise DockerAPIError(response.status, data)
+        return json_loads(data) if data else None
+
+    def close(self):
+        """Zamyka wolne połączenia z gniazdem Dockera."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return UnixHTTPConnection(self.socket_path, self.timeout)
+
+    def _release(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    def _send(self, conn, method, path, payload, headers):
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            return conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            raise
+
+    def containers(self, filters=None):
+        """Zwraca listę działających kontenerów (jedno zapytanie niezależnie od ich liczby)."""
+        query = {'all': 0, 'size': 0}
+        if filters:
+            query['filters'] = json.dumps(filters)
+        return self.request('GET', f"/containers/json?{urlencode(query)}")
+
+    def stats(self, container_id):
+        """Zwraca jednorazowy pomiar statystyk kontenera (bez ~1 s oczekiwania na drugą próbkę)."""
+        return self.request('GET', f"/containers/{container_id}/stats?stream=false&one-shot=true")
+
+    def update(self, container_id, **resources):
+        """Zmienia limity zasobów kontenera, np. update(id, Memory=..., CpuQuota=...)."""
+        return self.request('POST', f"/containers/{container_id}/update", resources)
+
+    def restart(self, container_id, stop_timeout=10):
+        """Restartuje kontener, czekając do stop_timeout sekund na jego zatrzymanie."""
+        # Docker odpowiada dopiero po zatrzymaniu i ponownym uruchomieniu kontenera
+        return self.request('POST', f"/containers/{container_id}/restart?t={stop_timeout}",
+                            timeout=self.timeout + stop_timeout)
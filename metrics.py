@@ -0,0 +1,45 @@
+import threading
+from prometheus_client import REGISTRY, Gauge, start_http_server
+
+_gauges = {}
+_collectors = {}
+_exporters = {}
+_registry_lock = threading.Lock()
+
+
+class CachedGauge:
+    """Gauge Prometheusa, który pomija set(), gdy wartość się nie zmieniła."""
+
+    def __init__(self, gauge):
+        self._gauge = gauge
+        self._last = None
+
+    def set(self, value):
+        if value != self._last:
+            self._last = value
+            self._gauge.set(value)
+
+
+def gauge(name, documentation):
+    """Zwraca współdzielony gauge o podanej nazwie; rejestruje go w REGISTRY tylko przy pierwszym wywołaniu."""
+    with _registry_lock:
+        if name not in _gauges:
+            _gauges[name] = CachedGauge(Gauge(name, documentation))
+        return _gauges[name]
+
+
+def collector(name, factory):
+    """Zwraca współdzielony kolektor o podanej nazwie; tworzy go przez factory() i rejestruje w REGISTRY tylko raz."""
+    with _registry_lock:
+        if name not in _collectors:
+            _collectors[name] = factory()
+            REGISTRY.register(_collectors[name])
+        return _collectors[name]
+
+
+def start_exporter(port):
+    """Uruchamia serwer HTTP z metrykami na danym porcie tylko raz w procesie; kolejne wywołania nic nie robią."""
+    with _registry_lock:
+        if not _exporters.get(port):
+            start_http_server(port)
+            _exporters[port] = True
@@ -1,8 +1,9 @@
 import docker
+import os
 import time
 import random
 import psutil
-from prometheus_client import Gauge, start_http_server
+from metrics import gauge, start_exporter
 
 class ShadowBotManager:
     def __init__(self, max_bots=5, image_name="shadow_bot_image", cpu_limit=0.5, mem_limit="256m"):
@@ -18,13 +19,18 @@ class ShadowBotManager:
         self.cpu_limit = cpu_limit
         self.mem_limit = mem_limit
         self.bots = {}
+        # Własny generator zamiast współdzielonego modułu random
+        self._rng = random.Random(os.urandom(16))
+        # Nazwy botów w liście + indeks nazwy w liście: losowanie i usuwanie w O(1)
+        self._bot_names = []
+        self._bot_idx = {}
 
         # Prometheus metrics
-        self.bot_count_gauge = Gauge('shadow_bot_count', 'Number of running Shadow Bots')
-        self.system_cpu_gauge = Gauge('system_cpu_usage', 'Overall system CPU usage')
-        self.system_mem_gauge = Gauge('system_mem_usage', 'Overall system memory usage')
+        self.bot_count_gauge = gauge('shadow_bot_count', 'Number of running Shadow Bots')
+        self.system_cpu_gauge = gauge('system_cpu_usage_instant', 'Instantaneous system CPU usage')
+        self.system_mem_gauge = gauge('system_mem_usage_instant', 'Instantaneous system memory usage')
 
-        start_http_server(9000)
+        start_exporter(9000)
     
     def create_shadow_bot(self, bot_name=None):
         """Tworzy i uruchamia nowego bota w osobnym kontenerze."""
@@ -32,7 +38,7 @@ class ShadowBotManager:
             print("Maksymalna liczba botów osiągnięta. Nie można uruchomić kolejnego.")
             return None
         
-        bot_name = bot_name or f"shadow_bot_{random.randint(1000, 9999)}"
+        bot_name = bot_name or f"shadow_bot_{self._rng.getrandbits(14):05d}"
         container = self.docker_client.containers.run(
             self.image_name,
             name=bot_name,
@@ -42,6 +48,8 @@ class ShadowBotManager:
             restart_policy={"Name": "always"}
         )
         self.bots[bot_name] = container
+        self._bot_idx[bot_name] = len(self._bot_names)
+        self._bot_names.append(bot_name)
         self.bot_count_gauge.set(len(self.bots))
         print(f"Uruchomiono Shadow Bota: {bot_name}")
         return container
@@ -51,6 +59,12 @@ class ShadowBotManager:
         if bot_name in self.bots:
             self.bots[bot_name].remove(force=True)
             del self.bots[bot_name]
+            # Zamiana z ostatnim elementem i pop() zamiast przesuwania całej listy
+            idx = self._bot_idx.pop(bot_name)
+            last_name = self._bot_names.pop()
+            if last_name != bot_name:
+                self._bot_names[idx] = last_name
+                self._bot_idx[last_name] = idx
             self.bot_count_gauge.set(len(self.bots))
             print(f"Zatrzymano i usunięto bota: {bot_name}")
         else:
@@ -58,7 +72,7 @@ class ShadowBotManager:
     
     def list_running_bots(self):
         """Zwraca listę aktualnie działających botów."""
-        return list(self.bots.keys())
+        return list(self._bot_names)
     
     def auto_scale_bots(self):
         """Automatycznie skaluje liczbę botów w zależności od obciążenia systemu."""
@@ -67,11 +81,11 @@ class ShadowBotManager:
         self.system_cpu_gauge.set(system_cpu)
         self.system_mem_gauge.set(system_mem)
         
-        if system_cpu > 80 or system_mem > 80 and len(self.bots) < self.max_bots:
+        if (system_cpu > 80 or system_mem > 80) and len(self.bots) < self.max_bots:
             print("Wysokie obciążenie systemu - dodanie nowego Shadow Bota.")
             self.create_shadow_bot()
         elif system_cpu < 30 and system_mem < 30 and len(self.bots) > 1:
-            bot_to_remove = random.choice(self.list_running_bots())
+            bot_to_remove = self._bot_names[self._rng.randrange(len(self._bot_names))]
             print(f"Niskie obciążenie systemu - usunięcie Shadow Bota: {bot_to_remove}.")
             self.stop_shadow_bot(bot_to_remove)
         
@@ -1,12 +1,141 @@
+import atexit
+import os
 import threading
 import queue
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import time
 import random
 import docker
+import numpy as np
 import psutil
 import requests
+from requests.adapters import HTTPAdapter
 import sqlite3
-from prometheus_client import start_http_server, Gauge
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from metrics import collector, gauge, start_exporter
+from docker_uds import DockerUDS
+
+try:
+    from numba import njit
+except ImportError:
+    # numba jest opcjonalna - bez niej średnie liczy numpy
+    njit = None
+
+# WAL + synchronous=NORMAL: brak fsync przy każdym INSERT, odczyty nie blokują zapisu.
+# Te ustawienia dotyczą pojedynczej bazy, więc stosujemy je też do każdej bazy dołączonej przez ATTACH.
+SQLITE_SCHEMA_PRAGMAS = '''
+    PRAGMA {schema}.journal_mode=WAL;
+    PRAGMA {schema}.synchronous=NORMAL;
+    PRAGMA {schema}.mmap_size=268435456;
+    PRAGMA {schema}.cache_size=-65536;
+'''
+# Ustawienia całego połączenia
+SQLITE_PRAGMAS = '''
+    PRAGMA temp_store=MEMORY;
+    PRAGMA busy_timeout=3000;
+    PRAGMA wal_autocheckpoint=10000;
+'''
+
+# Tabela logów: timestamp to sekundy epoki (INTEGER zajmuje mniej miejsca niż tekst ISO)
+LOGS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {schema}.logs (
+        timestamp INTEGER,
+        event TEXT
+    );
+    CREATE INDEX IF NOT EXISTS {schema}.idx_logs_ts ON logs(timestamp);
+'''
+# Nowe zdarzenia trafiają do dziennego pliku bazy dołączonego przez ATTACH jako logs_day
+INSERT_LOG_SQL = 'INSERT INTO logs_day.logs (timestamp, event) VALUES (?, ?)'
+
+LOG_STOP = None           # znacznik w kolejce logów kończący pracę wątku zapisu
+LOG_BATCH_SIZE = 256      # maksymalna liczba wierszy w jednej transakcji
+LOG_FLUSH_INTERVAL = 0.2  # maksymalny czas (sekundy) oczekiwania na zapełnienie paczki
+LOG_IDLE_TIMEOUT = 1.0    # czas (sekundy) bez nowych zdarzeń, po którym wątek zapisu uznaje się za bezczynny
+CHECKPOINT_INTERVAL = 60  # minimalny odstęp (sekundy) między checkpointami WAL wykonywanymi w bezczynności
+WORKER_IDLE_TIMEOUT = 0.5 # zabezpieczenie: maksymalny czas uśpienia wątku bez zadań przed ponownym przeszukaniem kolejek
+
+WEBHOOK_TIMEOUT = 2       # limit czasu (sekundy) na wysłanie webhooka
+MONITOR_INTERVAL = 15     # odstęp (sekundy) między okresowymi pomiarami kontenerów
+# Zdarzenia Dockera obsługiwane od razu: OOM przyspiesza najbliższy pomiar, start (np. po restarcie) odtwarza pliki cgroup
+MONITOR_EVENTS = ('oom', 'start')
+HISTORY_SIZE = 10         # liczba ostatnich pomiarów uśredniana przy decyzjach o skalowaniu
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+# Możliwe położenia cgroup v2 kontenera: sterownik systemd lub cgroupfs
+CGROUP_PATHS = ('system.slice/docker-{id}.scope', 'docker/{id}')
+
+def _threshold_flags(avg_cpu, avg_mem, avg_system_cpu, avg_system_mem, mem_limit):
+    """Zwraca flagi na podstawie średnich: (zwiększ RAM, zwiększ CPU, restart, skaluj system)."""
+    mem_ratio = avg_mem / mem_limit
+    return (mem_ratio > 0.8 or avg_system_mem > 85,
+            avg_cpu > 50000 or avg_system_cpu > 85,
+            mem_ratio > 0.9 or avg_cpu > 70000,
+            avg_cpu > 60000 or mem_ratio > 0.85)
+
+if njit is not None:
+    _threshold_flags = njit(cache=True)(_threshold_flags)
+
+    @njit(cache=True)
+    def _compute_thresholds(hist, filled, mem_limit):
+        """Uśrednia pierwsze filled pomiarów z bufora i zwraca flagi: (zwiększ RAM, zwiększ CPU, restart, skaluj system)."""
+        avg_cpu = avg_mem = avg_system_cpu = avg_system_mem = 0.0
+        for i in range(filled):
+            avg_cpu += hist[0, i]
+            avg_mem += hist[1, i]
+            avg_system_cpu += hist[2, i]
+            avg_system_mem += hist[3, i]
+        return _threshold_flags(avg_cpu / filled, avg_mem / filled,
+                                avg_system_cpu / filled, avg_system_mem / filled, mem_limit)
+else:
+    def _compute_thresholds(hist, filled, mem_limit):
+        """Uśrednia pierwsze filled pomiarów z bufora i zwraca flagi: (zwiększ RAM, zwiększ CPU, restart, skaluj system)."""
+        # Pętla w Pythonie byłaby wolniejsza niż jedna redukcja numpy
+        return _threshold_flags(*hist[:, :filled].mean(axis=1).tolist(), mem_limit)
+
+class ContainerState:
+    """Stan monitorowania jednego kontenera: bufor cykliczny pomiarów, otwarte pliki cgroup i zlecone zmiany kontenera."""
+    def __init__(self, cgroup_fds):
+        # Wiersze: cpu, mem, system_cpu, system_mem; kolumny to kolejne pomiary
+        self.hist = np.zeros((4, HISTORY_SIZE), dtype=np.float64)
+        self.idx = 0
+        self.cgroup_fds = cgroup_fds
+        # Future ostatnio zleconych operacji update/restart wykonywanych w puli wątków I/O
+        self.pending = None
+
+class ContainerLoadCollector(Collector):
+    """Kolektor Prometheusa liczący średnie obciążenie kontenerów dopiero przy odczycie metryk."""
+    def __init__(self):
+        self._sources = []
+
+    def add_source(self, container_states):
+        """Dodaje słownik stanów kontenerów (nazwa bota -> ContainerState) do eksportowanych metryk."""
+        self._sources.append(container_states)
+
+    def remove_source(self, container_states):
+        """Usuwa słownik stanów kontenerów dodany przez add_source (np. przy zamykaniu TaskManagera)."""
+        if container_states in self._sources:
+            self._sources.remove(container_states)
+
+    def collect(self):
+        cpu = GaugeMetricFamily('bot_cpu_usage', 'CPU usage of bots', labels=['bot'])
+        mem = GaugeMetricFamily('bot_mem_usage', 'Memory usage of bots', labels=['bot'])
+        seen = set()
+        for container_states in list(self._sources):
+            for bot_name, state in list(container_states.items()):
+                filled = min(state.idx, HISTORY_SIZE)
+                # Ten sam bot w dwóch managerach dałby zduplikowaną serię - eksportujemy pierwszy
+                if not filled or bot_name in seen:
+                    continue
+                seen.add(bot_name)
+                avg_cpu, avg_mem = state.hist[:2, :filled].mean(axis=1)
+                cpu.add_metric([bot_name], avg_cpu)
+                mem.add_metric([bot_name], avg_mem)
+        yield cpu
+        yield mem
 
 class TaskManager:
     def __init__(self, max_threads=5, api_rate_limit=1.5, max_containers=3, webhook_url=None, db_path='task_manager.db'):
@@ -17,106 +146,461 @@ class TaskManager:
         :param webhook_url: URL do wysyłania powiadomień webhookiem.
         :param db_path: Ścieżka do bazy danych SQLite do przechowywania logów.
         """
-        self.task_queue = queue.PriorityQueue()
         self.max_threads = max_threads
+        # Osobna kolejka (deque) i blokada dla każdego wątku roboczego; bezczynne wątki kradną zadania innym
+        self._queues = [deque() for _ in range(max_threads)]
+        self._queue_locks = [threading.Lock() for _ in range(max_threads)]
+        self._next_queue = itertools.count()
+        self._tasks_available = threading.Condition()
+        # Liczba zadań dodanych, a jeszcze niepobranych; zmieniana pod self._tasks_available
+        self._pending_tasks = 0
+        self._rng = random.Random(os.urandom(16))
         self.api_rate_limit = api_rate_limit
         self.max_containers = max_containers
         self.webhook_url = webhook_url
         self.db_path = db_path
+        # Sesja HTTP z pulą połączeń keep-alive - kolejne webhooki nie otwierają nowego połączenia TCP/TLS
+        self._http = requests.Session()
+        self._http.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        self._http.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        # Webhooki i operacje na kontenerach (update, restart) są wykonywane w tle, aby nie blokować pętli monitorującej
+        self._io_pool = ThreadPoolExecutor(max_workers=4)
         self.threads = []
         self.lock = threading.Lock()
         self.last_request_time = time.time()
         self.docker_client = docker.from_env()
+        # Trwałe połączenia z gniazdem Dockera dla zapytań wykonywanych w każdym cyklu monitorowania
+        self._docker = DockerUDS()
         self.containers = {}
-        self.load_history = []
+        self._container_states = {}
+        self._monitor_lock = threading.Lock()
+        # Id kontenera -> nazwa bota, odświeżane przy każdym pomiarze; zdarzenia nie przeszukują self.containers
+        self._container_ids = {}
+        self._sweep_now = threading.Event()
+        # Ustawiane w close(): kończy pętle pomiarów, zdarzeń Dockera i wątków roboczych
+        self._stop = threading.Event()
+        self._events_stream = None
+
+        # Prometheus metrics; obciążenie botów jest liczone z buforów pomiarów dopiero przy odczycie
+        self._load_collector = collector('container_load', ContainerLoadCollector)
+        self._load_collector.add_source(self._container_states)
+        # Średnie obciążenie systemu z HISTORY_SIZE ostatnich cykli pomiarów (wiersze: cpu, mem)
+        self._system_hist = np.zeros((2, HISTORY_SIZE), dtype=np.float64)
+        self._system_idx = 0
+        self.system_cpu_gauge = gauge('system_cpu_usage', 'System CPU usage averaged over recent sweeps')
+        self.system_mem_gauge = gauge('system_mem_usage', 'System memory usage averaged over recent sweeps')
 
-        # Prometheus metrics
-        self.cpu_usage_gauge = Gauge('bot_cpu_usage', 'CPU usage of bots')
-        self.mem_usage_gauge = Gauge('bot_mem_usage', 'Memory usage of bots')
-        self.system_cpu_gauge = Gauge('system_cpu_usage', 'Overall system CPU usage')
-        self.system_mem_gauge = Gauge('system_mem_usage', 'Overall system memory usage')
+        start_exporter(8000)
 
-        start_http_server(8000)
+        # Jedno trwałe połączenie w trybie autocommit, współdzielone przez wątki (chronione self.lock)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None,
+                                     cached_statements=100)
+        self._conn.executescript(SQLITE_PRAGMAS + SQLITE_SCHEMA_PRAGMAS.format(schema='main'))
+        self._log_day = None
         self._initialize_database()
 
+        # Zdarzenia trafiają do kolejki, a jeden wątek zapisuje je paczkami w jednej transakcji
+        self._log_q = queue.SimpleQueue()
+        self._log_thread = threading.Thread(target=self._log_writer, daemon=True)
+        self._log_thread.start()
+        # Zdarzenia czekające w kolejce są zapisywane także przy zamykaniu programu
+        atexit.register(self.close)
+
+        # Jeden wątek monitoruje wszystkie kontenery zamiast osobnego wątku na każdego bota
+        self._monitor_thread = threading.Thread(target=self._monitor_containers, daemon=True)
+        self._monitor_thread.start()
+        self._events_thread = threading.Thread(target=self._watch_events, daemon=True)
+        self._events_thread.start()
+
+    def close(self):
+        """Zatrzymuje wątki managera, zapisuje zdarzenia pozostałe w kolejce i zwalnia połączenia, pliki i metryki."""
+        atexit.unregister(self.close)
+        self._load_collector.remove_source(self._container_states)
+
+        self._stop.set()
+        self._sweep_now.set()
+        events_stream = self._events_stream
+        if events_stream is not None:
+            # Przerywa blokujące oczekiwanie na kolejne zdarzenie
+            events_stream.close()
+        with self._tasks_available:
+            self._tasks_available.notify_all()
+        self._monitor_thread.join()
+        # Strumień zdarzeń może nie przerwać odczytu od razu; wątek jest demonem, więc nie czekamy dłużej niż cykl
+        self._events_thread.join(MONITOR_INTERVAL)
+
+        with self._monitor_lock:
+            for state in self._container_states.values():
+                self._close_cgroup(state.cgroup_fds)
+            self._container_states.clear()
+
+        # Po zatrzymaniu pomiarów nic nie zleca nowych operacji; czekamy na zlecone webhooki i zmiany kontenerów
+        self._io_pool.shutdown()
+        self._http.close()
+        self._docker.close()
+
+        if self._log_thread.is_alive():
+            self._log_q.put(LOG_STOP)
+            self._log_thread.join()
+        with self.lock:
+            self._conn.close()
+
+    def add_task(self, func, *args, **kwargs):
+        """Dodaje zadanie do kolejki jednego z wątków roboczych (round-robin)."""
+        idx = next(self._next_queue) % self.max_threads
+        with self._queue_locks[idx]:
+            self._queues[idx].appendleft((func, args, kwargs))
+        with self._tasks_available:
+            self._pending_tasks += 1
+            self._tasks_available.notify()
+
+    def start_workers(self):
+        """Uruchamia max_threads wątków roboczych przetwarzających zadania."""
+        for idx in range(self.max_threads):
+            thread = threading.Thread(target=self._worker, args=(idx,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _next_task(self, idx):
+        """Pobiera zadanie z własnej kolejki wątku, a gdy jest pusta - kradnie je z kolejki innego wątku."""
+        with self._queue_locks[idx]:
+            if self._queues[idx]:
+                return self._queues[idx].pop()
+
+        start = self._rng.randrange(self.max_threads)
+        for offset in range(self.max_threads):
+            victim = (start + offset) % self.max_threads
+            if victim == idx:
+                continue
+            lock = self._queue_locks[victim]
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                if self._queues[victim]:
+                    return self._queues[victim].popleft()
+            finally:
+                lock.release()
+        return None
+
+    def _worker(self, idx):
+        """Pętla wątku roboczego: wykonuje zadania z własnej kolejki lub skradzione z innych."""
+        while not self._stop.is_set():
+            task = self._next_task(idx)
+            if task is None:
+                with self._tasks_available:
+                    # Zadanie dodane po nieudanym przeszukaniu kolejek nie czeka na timeout - szukamy od razu ponownie
+                    if self._pending_tasks <= 0 and not self._stop.is_set():
+                        self._tasks_available.wait(WORKER_IDLE_TIMEOUT)
+                continue
+
+            with self._tasks_available:
+                self._pending_tasks -= 1
+            func, args, kwargs = task
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                print(f"Błąd podczas wykonywania zadania: {e}")
+
     def _initialize_database(self):
-        """Inicjalizuje bazę danych SQLite do przechowywania logów."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''CREATE TABLE IF NOT EXISTS logs (
-                            timestamp TEXT,
-                            event TEXT
-                          )''')
-        conn.commit()
-        conn.close()
+        """Inicjalizuje bazę danych SQLite do przechowywania logów i dołącza plik logów z bieżącego dnia."""
+        with self.lock:
+            self._migrate_legacy_logs()
+            self._rotate_log_partition()
 
-    def _log_event(self, event):
-        """Zapisuje zdarzenie do bazy danych."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO logs (timestamp, event) VALUES (?, ?)', (time.strftime('%Y-%m-%d %H:%M:%S'), event))
-        conn.commit()
-        conn.close()
-
-    def _monitor_container(self, bot_name):
-        """Monitoruje kontener, dynamicznie dostosowuje CPU i RAM, skaluje system, integracja z Prometheus."""
-        container = self.containers.get(bot_name)
-        if not container:
+    def _migrate_legacy_logs(self):
+        """Przenosi starą tabelę logs (timestamp jako tekst) w głównej bazie na znaczniki czasu INTEGER z indeksem."""
+        columns = {row[1]: row[2] for row in self._conn.execute('PRAGMA main.table_info(logs)')}
+        if columns.get('timestamp') != 'TEXT':
             return
-        
+        try:
+            # Stare znaczniki były zapisywane w czasie lokalnym
+            self._conn.executescript('''
+                BEGIN;
+                ALTER TABLE main.logs RENAME TO logs_legacy;
+            ''' + LOGS_SCHEMA.format(schema='main') + '''
+                INSERT INTO main.logs (timestamp, event)
+                    SELECT CAST(strftime('%s', timestamp, 'utc') AS INTEGER), event FROM main.logs_legacy;
+                DROP TABLE main.logs_legacy;
+                COMMIT;
+            ''')
+        except sqlite3.Error:
+            if self._conn.in_transaction:
+                self._conn.execute('ROLLBACK')
+            raise
+
+    def _log_partition_path(self, day):
+        """Zwraca ścieżkę pliku bazy z logami z danego dnia (RRRRMMDD)."""
+        if self.db_path == ':memory:':
+            return ':memory:'
+        root, ext = os.path.splitext(self.db_path)
+        return f"{root}-{day}{ext or '.db'}"
+
+    def _rotate_log_partition(self):
+        """Dołącza plik logów z bieżącego dnia jako logs_day, odłączając plik z poprzedniego dnia. Wymaga self.lock."""
+        day = time.strftime('%Y%m%d')
+        if day == self._log_day:
+            return
+        if self._log_day is not None:
+            self._conn.execute('DETACH DATABASE logs_day')
+            # Gdy ATTACH się nie powiedzie, kolejna paczka spróbuje dołączyć plik od nowa
+            self._log_day = None
+        self._conn.execute('ATTACH DATABASE ? AS logs_day', (self._log_partition_path(day),))
+        try:
+            self._conn.executescript(SQLITE_SCHEMA_PRAGMAS.format(schema='logs_day') +
+                                     LOGS_SCHEMA.format(schema='logs_day'))
+        except sqlite3.Error:
+            self._conn.execute('DETACH DATABASE logs_day')
+            raise
+        self._log_day = day
+
+    def _log_event(self, event):
+        """Dodaje zdarzenie do kolejki zapisu do bazy danych (nie blokuje)."""
+        self._log_q.put((int(time.time()), event))
+
+    def _log_writer(self):
+        """Zapisuje zdarzenia z kolejki do bazy danych paczkami (do LOG_BATCH_SIZE wierszy lub LOG_FLUSH_INTERVAL sekund)."""
+        # Jeden kursor i stały tekst zapytania - skompilowany INSERT jest brany z cache połączenia
+        cursor = self._conn.cursor()
+        last_checkpoint = time.monotonic()
         while True:
-            stats = container.stats(stream=False)
-            cpu_usage = stats['cpu_stats']['cpu_usage']['total_usage']
-            mem_usage = stats['memory_stats']['usage']
-            mem_limit = stats['memory_stats']['limit']
-            system_cpu_usage = psutil.cpu_percent()
-            system_mem_usage = psutil.virtual_memory().percent
-            
-            self.load_history.append((cpu_usage, mem_usage, system_cpu_usage, system_mem_usage))
-            if len(self.load_history) > 10:
-                self.load_history.pop(0)
-            
-            avg_cpu = sum(x[0] for x in self.load_history) / len(self.load_history)
-            avg_mem = sum(x[1] for x in self.load_history) / len(self.load_history)
-            avg_system_cpu = sum(x[2] for x in self.load_history) / len(self.load_history)
-            avg_system_mem = sum(x[3] for x in self.load_history) / len(self.load_history)
-
-            # Prometheus metrics update
-            self.cpu_usage_gauge.set(avg_cpu)
-            self.mem_usage_gauge.set(avg_mem)
+            try:
+                item = self._log_q.get(timeout=LOG_IDLE_TIMEOUT)
+            except queue.Empty:
+                # Checkpoint w bezczynności, żeby fsync nie trafiał na środek serii zapisów
+                if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    with self.lock:
+                        try:
+                            cursor.execute('PRAGMA wal_checkpoint(PASSIVE)')
+                        except sqlite3.Error as e:
+                            print(f"Błąd podczas checkpointu WAL: {e}")
+                    last_checkpoint = time.monotonic()
+                continue
+
+            stop = item is LOG_STOP
+            batch = [] if stop else [item]
+            deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+            while not stop and len(batch) < LOG_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._log_q.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is LOG_STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            if batch:
+                with self.lock:
+                    try:
+                        # Po północy zapisujemy do nowego pliku dziennego
+                        self._rotate_log_partition()
+                        cursor.execute('BEGIN')
+                        cursor.executemany(INSERT_LOG_SQL, batch)
+                        cursor.execute('COMMIT')
+                    except sqlite3.Error as e:
+                        if self._conn.in_transaction:
+                            self._conn.execute('ROLLBACK')
+                        print(f"Błąd podczas zapisu logów do bazy danych: {e}")
+            if stop:
+                return
+
+    def _open_cgroup(self, container):
+        """Otwiera pliki cgroup v2 kontenera (cpu.stat, memory.current, memory.max). Zwraca None, gdy są niedostępne."""
+        for pattern in CGROUP_PATHS:
+            path = os.path.join(CGROUP_ROOT, pattern.format(id=container.id))
+            fds = []
+            try:
+                for name in ('cpu.stat', 'memory.current', 'memory.max'):
+                    fds.append(os.open(os.path.join(path, name), os.O_RDONLY))
+            except OSError:
+                self._close_cgroup(fds)
+                continue
+            return fds
+        return None
+
+    def _close_cgroup(self, fds):
+        """Zamyka deskryptory plików cgroup."""
+        for fd in fds or ():
+            os.close(fd)
+
+    def _read_cgroup_stats(self, fds):
+        """Odczytuje zużycie CPU (ns), zużycie i limit pamięci kontenera z otwartych plików cgroup."""
+        cpu_fd, mem_fd, max_fd = fds
+        cpu_usage = 0
+        for line in os.pread(cpu_fd, 512, 0).splitlines():
+            if line.startswith(b'usage_usec '):
+                # Docker API raportuje total_usage w nanosekundach
+                cpu_usage = int(line.split()[1]) * 1000
+                break
+        mem_usage = int(os.pread(mem_fd, 32, 0))
+        mem_max = os.pread(max_fd, 32, 0).strip()
+        # Bez limitu Docker API raportuje całą pamięć hosta
+        mem_limit = psutil.virtual_memory().total if mem_max == b'max' else int(mem_max)
+        return cpu_usage, mem_usage, mem_limit
+
+    def _read_docker_stats(self, container):
+        """Pobiera zużycie CPU, zużycie i limit pamięci kontenera przez Docker API."""
+        stats = self._docker.stats(container.id)
+        return (stats['cpu_stats']['cpu_usage']['total_usage'],
+                stats['memory_stats']['usage'],
+                stats['memory_stats']['limit'])
+
+    def _monitor_containers(self):
+        """Co MONITOR_INTERVAL sekund (lub wcześniej po OOM) sprawdza wszystkie działające kontenery jednym zapytaniem i monitoruje każdy z nich."""
+        while not self._stop.is_set():
+            containers = dict(self.containers)
+            self._container_ids = {container.id: bot_name for bot_name, container in containers.items()}
+            system_usage = self._system_usage()
+            self._system_hist[:, self._system_idx % HISTORY_SIZE] = system_usage
+            self._system_idx += 1
+            avg_system_cpu, avg_system_mem = self._system_hist[:, :min(self._system_idx, HISTORY_SIZE)].mean(axis=1)
             self.system_cpu_gauge.set(avg_system_cpu)
             self.system_mem_gauge.set(avg_system_mem)
-            
-            if avg_mem / mem_limit > 0.8 or avg_system_mem > 85:
-                message = f"Zwiększanie zasobów RAM dla kontenera {bot_name}."
-                self._send_webhook_alert(message)
-                self._log_event(message)
-                container.update(mem_limit=str(int(mem_limit * 1.2)))
-            
-            if avg_cpu > 50000 or avg_system_cpu > 85:
-                message = f"Zwiększanie zasobów CPU dla kontenera {bot_name}."
-                self._send_webhook_alert(message)
-                self._log_event(message)
-                container.update(cpu_quota=int(avg_cpu * 1.2))
-            
-            if avg_mem / mem_limit > 0.9 or avg_cpu > 70000:
-                message = f"Restartowanie kontenera {bot_name} z powodu wysokiego zużycia zasobów."
-                self._send_webhook_alert(message)
-                self._log_event(message)
-                container.restart()
-            
-            if avg_cpu > 60000 or avg_mem / mem_limit > 0.85:
-                message = "Skalowanie systemu: dodawanie nowego kontenera."
-                self._send_webhook_alert(message)
-                self._log_event(message)
-                self._scale_up(container.image.tags[0])
-            
-            time.sleep(5)
+            if containers:
+                try:
+                    running = {c['Id'] for c in self._docker.containers(filters={'id': [c.id for c in containers.values()]})}
+                except Exception as e:
+                    print(f"Błąd podczas pobierania listy kontenerów: {e}")
+                    running = set()
+
+                with self._monitor_lock:
+                    for bot_name, container in containers.items():
+                        if container.id not in running:
+                            continue
+                        try:
+                            self._monitor_container(bot_name, container, system_usage)
+                        except Exception as e:
+                            print(f"Błąd podczas monitorowania kontenera {bot_name}: {e}")
+
+            # Usuwamy stan botów, których już nie ma (także gdy usunięto ostatniego) - zamyka pliki cgroup i ich metryki
+            with self._monitor_lock:
+                for bot_name in self._container_states.keys() - containers.keys():
+                    self._close_cgroup(self._container_states.pop(bot_name).cgroup_fds)
+
+            self._sweep_now.wait(MONITOR_INTERVAL)
+            self._sweep_now.clear()
+
+    def _watch_events(self):
+        """Nasłuchuje zdarzeń Dockera (jeden strumień dla wszystkich kontenerów) i reaguje na nie między okresowymi pomiarami."""
+        filters = {'type': 'container', 'event': list(MONITOR_EVENTS)}
+        while not self._stop.is_set():
+            stream = None
+            try:
+                stream = self._events_stream = self.docker_client.api.events(decode=True, filters=filters)
+                # close() mógł zostać wywołany, zanim strumień został zapisany w self._events_stream
+                if self._stop.is_set():
+                    break
+                for event in stream:
+                    if self._stop.is_set():
+                        break
+                    self._handle_event(event)
+            except Exception as e:
+                if not self._stop.is_set():
+                    print(f"Błąd strumienia zdarzeń Dockera: {e}")
+            finally:
+                self._events_stream = None
+                if stream is not None:
+                    stream.close()
+            self._stop.wait(MONITOR_INTERVAL)
+
+    def _handle_event(self, event):
+        """Obsługuje pojedyncze zdarzenie Dockera dotyczące monitorowanego kontenera."""
+        bot_name = self._container_ids.get(event.get('id'))
+        if bot_name is None:
+            return
+
+        if event.get('Action') == 'oom':
+            # Przyspieszamy najbliższy cykl pomiarów zamiast dopisywać do historii dodatkową próbkę
+            self._sweep_now.set()
+            return
+
+        container = self.containers.get(bot_name)
+        with self._monitor_lock:
+            state = self._container_states.get(bot_name)
+            if state and container:
+                self._close_cgroup(state.cgroup_fds)
+                state.cgroup_fds = self._open_cgroup(container)
+
+    def _system_usage(self):
+        """Zwraca bieżące zużycie CPU i pamięci całego systemu (w procentach)."""
+        return psutil.cpu_percent(), psutil.virtual_memory().percent
+
+    def _monitor_container(self, bot_name, container, system_usage):
+        """Wykonuje jeden pomiar kontenera, dynamicznie dostosowuje CPU i RAM, skaluje system."""
+        state = self._container_states.get(bot_name)
+        if state is None:
+            # Bezpośredni odczyt cgroup omija zapytanie HTTP i ~1 s próbkowania w statystykach Dockera
+            state = self._container_states[bot_name] = ContainerState(self._open_cgroup(container))
+
+        stats = None
+        if state.cgroup_fds:
+            try:
+                stats = self._read_cgroup_stats(state.cgroup_fds)
+            except (OSError, ValueError):
+                # Po restarcie kontenera cgroup jest tworzona od nowa
+                self._close_cgroup(state.cgroup_fds)
+                state.cgroup_fds = self._open_cgroup(container)
+        if stats is None:
+            stats = self._read_docker_stats(container)
+        cpu_usage, mem_usage, mem_limit = stats
+        system_cpu_usage, system_mem_usage = system_usage
+
+        state.hist[:, state.idx % HISTORY_SIZE] = (cpu_usage, mem_usage, system_cpu_usage, system_mem_usage)
+        state.idx += 1
+        # Dopóki bufor nie jest pełny, uśredniamy tylko zapisane kolumny
+        filled = min(state.idx, HISTORY_SIZE)
+        grow_mem, grow_cpu, restart, scale_up = _compute_thresholds(state.hist, filled, float(mem_limit))
+        if state.pending is not None and not state.pending.done():
+            # Poprzednie zmiany (np. restart) jeszcze trwają - nie zlecamy kolejnych, żeby się nie nakładały
+            grow_mem = grow_cpu = restart = False
+
+        actions = []
+        if grow_mem:
+            message = f"Zwiększanie zasobów RAM dla kontenera {bot_name}."
+            self._alert(message)
+            actions.append(partial(self._docker.update, container.id, Memory=int(mem_limit * 1.2)))
+
+        if grow_cpu:
+            message = f"Zwiększanie zasobów CPU dla kontenera {bot_name}."
+            self._alert(message)
+            avg_cpu = state.hist[0, :filled].mean()
+            actions.append(partial(self._docker.update, container.id, CpuQuota=int(avg_cpu * 1.2)))
+
+        if restart:
+            message = f"Restartowanie kontenera {bot_name} z powodu wysokiego zużycia zasobów."
+            self._alert(message)
+            actions.append(partial(self._docker.restart, container.id))
+
+        if actions:
+            # Restart może trwać kilka sekund; akcje jednego kontenera wykonujemy w tle, ale po kolei
+            state.pending = self._io_pool.submit(self._run_container_actions, bot_name, actions)
+
+        if scale_up:
+            message = "Skalowanie systemu: dodawanie nowego kontenera."
+            self._alert(message)
+            self._scale_up(container.image.tags[0])
+
+    def _run_container_actions(self, bot_name, actions):
+        """Wykonuje po kolei operacje Docker API dla kontenera (wywoływane w puli wątków I/O)."""
+        for action in actions:
+            try:
+                action()
+            except Exception as e:
+                print(f"Błąd podczas zmiany kontenera {bot_name}: {e}")
+                return
+
+    def _alert(self, message):
+        """Wysyła powiadomienie webhookiem w tle i zapisuje zdarzenie do bazy danych."""
+        self._io_pool.submit(self._send_webhook_alert, message)
+        self._log_event(message)
 
     def _send_webhook_alert(self, message):
         """Wysyła powiadomienie webhookiem o stanie systemu."""
         if self.webhook_url:
             try:
-                requests.post(self.webhook_url, json={"text": message})
+                self._http.post(self.webhook_url, json={"text": message}, timeout=WEBHOOK_TIMEOUT)
             except Exception as e:
-                print(f"Błąd podczas wysyłania webhooka: {e}")task_manager
+                print(f"Błąd podczas wysyłania webhooka: {e}")